@@ -1,16 +1,19 @@
+import csv
 import os
+import threading
 from ebaysdk.trading import Connection as Trading
 from ebaysdk.exception import ConnectionError
-import pandas as pd
-from datetime import datetime, timedelta
-from decimal import Decimal, ROUND_HALF_UP
-import pytz
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 import logging
 
 
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+log = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
@@ -23,6 +26,11 @@ TOKEN = os.getenv('TOKEN')
 if not all([DEVID, APPID, CERTID, TOKEN]):
     raise ValueError("One or more API credentials are missing.")
 
+# Hoisted so the tzdata file lookup happens once, not per get_date_range
+# call; zoneinfo is C-implemented and attaches directly via tzinfo=,
+# without pytz's localize() wrapper
+PACIFIC = ZoneInfo('US/Pacific')
+
 def prompt_for_year_and_month():
     current_year = datetime.now().year
     while True:
@@ -40,58 +48,89 @@ def prompt_for_year_and_month():
         except ValueError:
             print("Invalid input. Please enter numeric values for year and month.")
 
+@lru_cache(maxsize=32)
 def get_date_range(year, month):
     """
     Generates a start and end date range for the given year and month,
     localized to Pacific Time, and converts them to UTC for the API request.
     """
-    pacific = pytz.timezone('US/Pacific')
-
-    # Localize the start and end dates to Pacific Time
-    start_date = pacific.localize(datetime(year, month, 1))
+    # Build the start and end dates directly in Pacific Time
+    start_date = datetime(year, month, 1, tzinfo=PACIFIC)
     if month == 12:
-        end_date = pacific.localize(datetime(year + 1, 1, 1)) - timedelta(seconds=1)
+        end_date = datetime(year + 1, 1, 1, tzinfo=PACIFIC) - timedelta(seconds=1)
     else:
-        end_date = pacific.localize(datetime(year, month + 1, 1)) - timedelta(seconds=1)
+        end_date = datetime(year, month + 1, 1, tzinfo=PACIFIC) - timedelta(seconds=1)
 
     # Convert to UTC
-    start_date_utc = start_date.astimezone(pytz.utc)
-    end_date_utc = end_date.astimezone(pytz.utc)
+    start_date_utc = start_date.astimezone(timezone.utc)
+    end_date_utc = end_date.astimezone(timezone.utc)
 
     # Format the dates in ISO 8601 format with 'Z' to indicate UTC
     return start_date_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z'), end_date_utc.strftime('%Y-%m-%dT%H:%M:%S.000Z')
 
 
-def extract_decimal(transaction, key_path, default='0'):
+# Trading API responses live in this namespace; precompiled qualified paths
+# for the hot transaction fields so each one is a single C-level findtext
+EBAY_NS = '{urn:ebay:apis:eBLBaseComponents}'
+_TITLE_PATH = f'{EBAY_NS}Item/{EBAY_NS}Title'
+_ITEM_PRICE_PATH = f'{EBAY_NS}TransactionPrice'
+_SHIPPING_PATH = f'{EBAY_NS}ActualShippingCost'
+_TAX_PATH = f'{EBAY_NS}Taxes/{EBAY_NS}TotalTaxAmount'
+_FVF_PATH = f'{EBAY_NS}FinalValueFee'
+_HANDLING_PATH = f'{EBAY_NS}ActualHandlingCost'
+_TRANSACTION_TAG = f'{EBAY_NS}Transaction'
+_TOTAL_PAGES_PATH = f'.//{EBAY_NS}TotalNumberOfPages'
+
+def to_cents(amount):
+    """
+    Parse a raw amount string (e.g. '12.34') to integer cents.
+    """
+    return int(round(float(amount) * 100))
+
+@lru_cache(maxsize=32)
+def _trading_api(thread_id=None):
     """
-    Helper function to extract and convert decimal values from nested dictionaries.
-    
-    Args:
-    transaction (dict): The transaction dictionary to extract the value from.
-    key_path (list): A list of keys to navigate through the nested dictionaries.
-    default (str): The default value to use if any key is not found.
-
-    Returns:
-    Decimal: The extracted and rounded decimal value.
+    One cached Trading connection per worker thread, so the TLS handshake
+    and config load happen once instead of on every call. ebaysdk keeps
+    per-call state on the connection, hence the per-thread key.
     """
-    value = transaction  # Start with the entire transaction dictionary
-    for key in key_path:
-        value = value.get(key, {})  # Traverse through each level using keys in key_path
-    # After traversing, get the final 'value' and convert it to Decimal
-    return Decimal(value.get('value', default)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    return Trading(domain='api.ebay.com', appid=APPID, devid=DEVID, certid=CERTID, token=TOKEN, config_file=None)
 
 def fetch_sold_items(start_date, end_date):
+    """
+    Fetches all completed orders in the date range, following GetOrders
+    pagination. The first page reports the total page count; remaining
+    pages are requested concurrently since each call is a network round-trip.
+
+    Returns the parsed XML DOM of each page rather than ebaysdk's nested
+    dict conversion; iter_sales_rows walks the trees directly.
+    """
+    request = {
+        'DetailLevel': 'ReturnAll',
+        'CreateTimeFrom': start_date,
+        'CreateTimeTo': end_date,
+        'OrderStatus': 'Completed',
+        'IncludeFinalValueFee': True
+    }
+
+    def fetch_page(page_number):
+        api = _trading_api(threading.get_ident())
+        return api.execute('GetOrders', {
+            **request,
+            'Pagination': {'EntriesPerPage': 100, 'PageNumber': page_number}
+        }).dom()
+
     try:
-        api = Trading(domain='api.ebay.com', appid=APPID, devid=DEVID, certid=CERTID, token=TOKEN, config_file=None)
-        response = api.execute('GetOrders', {
-            'DetailLevel': 'ReturnAll',
-            'CreateTimeFrom': start_date,
-            'CreateTimeTo': end_date,
-            'OrderStatus': 'Completed',
-            'IncludeFinalValueFee': True
-        })
-        logging.info("API call successful. Response received.")
-        return response.dict()
+        first_page = fetch_page(1)
+        total_pages = int(first_page.findtext(_TOTAL_PAGES_PATH, '1'))
+
+        pages = [first_page]
+        if total_pages > 1:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                pages.extend(executor.map(fetch_page, range(2, total_pages + 1)))
+
+        logging.info(f"API call successful. {total_pages} page(s) received.")
+        return pages
     except ConnectionError as e:
         logging.error(f"Connection error occurred: {e}")
         return None
@@ -99,54 +138,62 @@ def fetch_sold_items(start_date, end_date):
         logging.error(f"An unexpected error occurred: {e}")
         return None
 
-def process_sales_data(orders):
-    if not orders:
+CSV_FIELDS = ['Title', 'SalePrice', 'NetSaleWithoutAdFee', 'NetSaleWithAdFee', 'COGS']
+
+def iter_sales_rows(pages):
+    """
+    Yields one computed CSV row per transaction, streaming rows straight off
+    the parsed XML trees instead of accumulating lists of nested dicts.
+    """
+    if not pages:
         logging.warning("No orders to process.")
-        return pd.DataFrame()
-
-    order_array = orders.get('OrderArray', {}).get('Order', [])
-    items = []
-    
-    for order in order_array:
-        for transaction in order.get('TransactionArray', {}).get('Transaction', []):
-            # Use extract_decimal to simplify getting each value
-            item_price = extract_decimal(transaction, ['TransactionPrice'])
-            shipping_cost = extract_decimal(transaction, ['ActualShippingCost'])
-            sales_tax = extract_decimal(transaction, ['Taxes', 'TotalTaxAmount'])
-            final_value_fee = extract_decimal(transaction, ['FinalValueFee'])
-            handling_cost = extract_decimal(transaction, ['ActualHandlingCost'])
-            
-            # Calculate ad fee at 2% of total price including handling cost
-            sale_price = item_price + shipping_cost + sales_tax + handling_cost
-            ad_fee = (sale_price * Decimal('0.02')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-
-            insertion_fee = Decimal(0.30 if sale_price <= Decimal('10.00') else 0.40).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-
-            # Calculate sale price and net sale without ad fee
-            net_sale_without_ad_fee = (sale_price - sales_tax - final_value_fee - insertion_fee - shipping_cost).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-
-            # Calculate net sale with ad fee
-            net_sale_with_ad_fee = (net_sale_without_ad_fee - ad_fee).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-
-            logging.info(f"Title: {transaction['Item']['Title']}")
-            logging.info(f"Item Price: {item_price}, Shipping Cost: {shipping_cost}, Sales Tax: {sales_tax}")
-            logging.info(f"Final Value Fee: {final_value_fee}, Handling Cost: {handling_cost}, Insertion Fee: {insertion_fee}, Ad Fee: {ad_fee}")
-            logging.info(f"Calculation Details:")
-            logging.info(f"Sale Price = Item Price ({item_price}) + Shipping Cost ({shipping_cost}) + Sales Tax ({sales_tax}) = {sale_price}")
-            logging.info(f"Net Sale without Ad Fee = Sale Price ({sale_price}) - Sales Tax ({sales_tax}) - Final Value Fee ({final_value_fee}) - Insertion Fee ({insertion_fee}) - Shipping Cost ({shipping_cost}) + Handling Cost ({handling_cost}) = {net_sale_without_ad_fee}")
-            logging.info(f"Net Sale with Ad Fee = Net Sale without Ad Fee ({net_sale_without_ad_fee}) - Ad Fee ({ad_fee}) = {net_sale_with_ad_fee}")
-
-            # Create the dictionary for each item
-            item = {
-                'Title': transaction['Item']['Title'],
-                'SalePrice': float(sale_price),
-                'NetSaleWithoutAdFee': float(net_sale_without_ad_fee),
-                'NetSaleWithAdFee': float(net_sale_with_ad_fee),
+        return
+
+    for page in pages:
+        for transaction in page.iter(_TRANSACTION_TAG):
+            title = transaction.findtext(_TITLE_PATH, '')
+
+            # All money math happens in integer cents; floats only appear
+            # once per row at the division below
+            item_cents = to_cents(transaction.findtext(_ITEM_PRICE_PATH, '0'))
+            shipping_cents = to_cents(transaction.findtext(_SHIPPING_PATH, '0'))
+            tax_cents = to_cents(transaction.findtext(_TAX_PATH, '0'))
+            final_value_fee_cents = to_cents(transaction.findtext(_FVF_PATH, '0'))
+            handling_cents = to_cents(transaction.findtext(_HANDLING_PATH, '0'))
+
+            # Ad fee at 2% of total price including handling cost;
+            # (x*2 + 50) // 100 is ROUND_HALF_UP in cents
+            sale_cents = item_cents + shipping_cents + tax_cents + handling_cents
+            ad_fee_cents = (sale_cents * 2 + 50) // 100
+            insertion_cents = 30 if sale_cents <= 1000 else 40
+
+            # Net sale without and with ad fee
+            net_without_ad_cents = sale_cents - tax_cents - final_value_fee_cents - insertion_cents - shipping_cents
+            net_with_ad_cents = net_without_ad_cents - ad_fee_cents
+
+            # Per-row detail is DEBUG only; the isEnabledFor guard plus
+            # %-style formatting keeps the hot loop free of string work
+            # when the level is INFO
+            if log.isEnabledFor(logging.DEBUG):
+                log.debug("Title: %s", title)
+                log.debug("Item Price: %d, Shipping Cost: %d, Sales Tax: %d (cents)",
+                          item_cents, shipping_cents, tax_cents)
+                log.debug("Final Value Fee: %d, Handling Cost: %d, Insertion Fee: %d, Ad Fee: %d (cents)",
+                          final_value_fee_cents, handling_cents, insertion_cents, ad_fee_cents)
+                log.debug("Sale Price: %d, Net Sale without Ad Fee: %d, Net Sale with Ad Fee: %d (cents)",
+                          sale_cents, net_without_ad_cents, net_with_ad_cents)
+
+            yield {
+                'Title': title,
+                'SalePrice': sale_cents / 100.0,
+                'NetSaleWithoutAdFee': net_without_ad_cents / 100.0,
+                'NetSaleWithAdFee': net_with_ad_cents / 100.0,
                 'COGS': ''  # Placeholder for COGS
             }
-            items.append(item)
-    
-    return pd.DataFrame(items)
+
+            # Release the subtree once the row is out so peak memory stays
+            # flat regardless of month size
+            transaction.clear()
 
 if __name__ == "__main__":
     year, month = prompt_for_year_and_month()
@@ -154,8 +201,10 @@ if __name__ == "__main__":
     orders = fetch_sold_items(start_date, end_date)
 
     if orders:
-        sales_data_df = process_sales_data(orders)
-        sales_data_df.to_csv('sales_data.csv', index=False)
+        with open('sales_data.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(iter_sales_rows(orders))
         print("Data exported to sales_data.csv")
     else:
         print("Failed to retrieve orders.")
\ No newline at end of file
@@ -1,6 +1,18 @@
 import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv  # Import the dotenv library
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson parses the large Finance API pages several times faster than the
+# stdlib json module; fall back gracefully when it isn't installed
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
 
 # Load environment variables from the .env file
 load_dotenv()
@@ -8,10 +20,19 @@ load_dotenv()
 # Fetch the OAuth User Token from the environment variable
 oauth_user_token = os.getenv('EBAY_OAUTH_USER_TOKEN')
 
+# Reuse one session so every page shares the same pooled connection, and
+# retry throttling/5xx responses with backoff
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504))
+))
+
 def get_promoted_listings_transactions(oauth_user_token):
     # Updated eBay Finance API endpoint to match API Explorer
     url = 'https://apiz.ebay.com/sell/finances/v1/transaction'
-    
+
     # Set up headers with the OAuth User Token
     headers = {
         'Authorization': f'Bearer {oauth_user_token}',  # Use the OAuth User Token
@@ -19,31 +40,42 @@ def get_promoted_listings_transactions(oauth_user_token):
         'X-EBAY-C-MARKETPLACE-ID': 'EBAY_US',  # Add marketplace header
         'Accept': 'application/json'  # Ensure Accept header matches the API Explorer
     }
+    limit = 1000  # Maximum page size the Finance API allows
 
-    # Define the parameters for the request
-    params = {
-        'limit': 10,  # Set a limit for how many transactions to return
-    }
+    def fetch_page(offset):
+        params = {'limit': str(limit), 'offset': str(offset)}
+        response = _SESSION.get(url, headers=headers, params=params)
+
+        # Enhanced error handling to provide more context
+        if response.status_code == 200:
+            return _loads(response.content)
+        elif response.status_code == 404:
+            print("Error: 404 Not Found - The requested resource could not be found.")
+        else:
+            print(f"Error fetching transactions: {response.status_code} - {response.text}")
+        return None
 
     # Debugging output to check the request
     print("Making request to eBay API...")
     print("URL:", url)
     print("Headers:", headers)
-    print("Parameters:", params)
 
-    # Make the GET request to the eBay Finance API
-    response = requests.get(url, headers=headers, params=params)
+    # The first page reports the total; remaining offset windows are fetched
+    # concurrently since each page is a network-bound round-trip
+    first_page = fetch_page(0)
+    if not first_page:
+        return None
+    print("API Call Successful!")
 
-    # Enhanced error handling to provide more context
-    if response.status_code == 200:
-        print("API Call Successful!")
-        return response.json()
-    elif response.status_code == 404:
-        print("Error: 404 Not Found - The requested resource could not be found.")
-        
-    else:
-        print(f"Error fetching transactions: {response.status_code} - {response.text}")
-    return None
+    transactions = list(first_page.get('transactions', []))
+    total = int(first_page.get('total', len(transactions)))
+    if total > limit:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for page in executor.map(fetch_page, range(limit, total, limit)):
+                if page:
+                    transactions.extend(page.get('transactions', []))
+
+    return transactions
 
 if __name__ == "__main__":
     # Check if the OAuth User Token is available
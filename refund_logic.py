@@ -1,9 +1,22 @@
 import os
 import requests
+from calendar import monthrange
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
 import pandas as pd
 
+# orjson parses the large Finance API pages several times faster than the
+# stdlib json module; fall back gracefully when it isn't installed
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
+
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 
@@ -15,9 +28,26 @@ oauth_user_token = os.getenv('EBAY_OAUTH_USER_TOKEN')
 if not oauth_user_token:
     raise ValueError("eBay Finance API token is missing.")
 
-def get_finance_transactions(oauth_user_token, start_date, end_date):
+# One pooled session for all Finance API pages: connections are reused
+# across requests (no TLS handshake per page) and throttling/5xx responses
+# are retried with backoff
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504))
+))
+
+def get_refund_transactions(oauth_user_token, start_date, end_date):
     """
-    Fetches financial transactions using eBay Finance API.
+    Fetches financial transactions using eBay Finance API and returns the
+    REFUND ones as a DataFrame.
+
+    The first page reports the total number of transactions; the remaining
+    offset windows are fetched concurrently since each page is a
+    network-bound round-trip. Only the displayed refund fields are kept,
+    collected into parallel per-column lists as each page arrives, so no
+    intermediate all-transactions structure is built.
     """
     base_url = 'https://apiz.ebay.com/sell/finances/v1/transaction'
     headers = {
@@ -25,68 +55,58 @@ def get_finance_transactions(oauth_user_token, start_date, end_date):
         'Accept': 'application/json',
         'X-EBAY-C-MARKETPLACE-ID': 'EBAY_US'
     }
-    params = {
-        'limit': '1000',
-        'transactionDateRangeFrom': start_date,
-        'transactionDateRangeTo': end_date
-    }
-    all_transactions = []
-    while True:
-        response = requests.get(base_url, headers=headers, params=params)
+    limit = 1000
+
+    def fetch_page(offset):
+        params = {
+            'limit': str(limit),
+            'offset': str(offset),
+            'transactionDateRangeFrom': start_date,
+            'transactionDateRangeTo': end_date
+        }
+        response = _SESSION.get(base_url, headers=headers, params=params)
         if response.status_code != 200:
             logging.error(f"Failed to fetch transactions: {response.status_code}, {response.text}")
-            break
+            return None
 
-        data = response.json()
-        transactions = data.get('transactions', [])
-        all_transactions.extend(transactions)
+        return _loads(response.content)
 
-        # Check if there's another page
-        if 'next' in data.get('href', ''):
-            params['offset'] = params.get('offset', 0) + int(params['limit'])
-        else:
-            break
+    # Parallel per-column lists (structure-of-arrays); appended to as each
+    # page arrives, then wrapped in a DataFrame once at the end
+    columns = {
+        'OrderID': [], 'RefundAmount': [], 'RefundDate': [], 'RefundType': [],
+        'TotalFeeBasis': [], 'TotalFee': [], 'LineItems': [], 'References': []
+    }
 
-    return pd.DataFrame(all_transactions)
-
-def process_refund_transactions(df):
-    """
-    Filter and process only transactions that are related to refunds.
-    """
-    # Filter for REFUND transactions only
-    refund_df = df[df['transactionType'] == 'REFUND']
-    if refund_df.empty:
-        logging.info("No refund transactions found for the specified period.")
-        return None
-
-    # Extract and format relevant fields
-    refund_data = []
-    for _, row in refund_df.iterrows():
-        order_id = row.get('orderId', 'None')
-        refund_amount = float(row['amount']['value'])
-        refund_date = row['transactionDate']
-        refund_type = row['transactionType']
-
-        # Retrieve additional details if available
-        fee_basis_amount = row.get('totalFeeBasisAmount', {}).get('value', 'None')
-        total_fee = row.get('totalFeeAmount', {}).get('value', 'None')
-        line_items = row.get('orderLineItems', [])
-        references = row.get('references', [])
-
-        # Collect refund details for output
-        refund_data.append({
-            'OrderID': order_id,
-            'RefundAmount': refund_amount,
-            'RefundDate': refund_date,
-            'RefundType': refund_type,
-            'TotalFeeBasis': fee_basis_amount,
-            'TotalFee': total_fee,
-            'LineItems': line_items,
-            'References': references
-        })
-
-    # Convert to DataFrame for better display
-    return pd.DataFrame(refund_data)
+    def collect(transactions):
+        for tx in transactions:
+            if tx.get('transactionType') != 'REFUND':
+                continue
+            columns['OrderID'].append(tx.get('orderId') or 'None')
+            columns['RefundAmount'].append(float(tx['amount']['value']))
+            columns['RefundDate'].append(tx.get('transactionDate'))
+            columns['RefundType'].append(tx['transactionType'])
+            columns['TotalFeeBasis'].append((tx.get('totalFeeBasisAmount') or {}).get('value', 'None'))
+            columns['TotalFee'].append((tx.get('totalFeeAmount') or {}).get('value', 'None'))
+            columns['LineItems'].append(tx.get('orderLineItems', []))
+            columns['References'].append(tx.get('references', []))
+
+    first_page = fetch_page(0)
+    if not first_page:
+        return pd.DataFrame()
+
+    first_transactions = first_page.get('transactions', [])
+    collect(first_transactions)
+    total = int(first_page.get('total', len(first_transactions)))
+
+    # Fan out over the remaining pages concurrently
+    if total > limit:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for page in executor.map(fetch_page, range(limit, total, limit)):
+                if page:
+                    collect(page.get('transactions', []))
+
+    return pd.DataFrame(columns)
 
 def display_refunds(refund_df):
     """
@@ -113,21 +133,19 @@ if __name__ == "__main__":
     year = input("Enter the year (e.g., 2024): ").strip()
     month = input("Enter the month (1-12): ").strip()
 
-    # Format the start and end dates based on user input
-    start_date = f"{year}-{month.zfill(2)}-01T00:00:00.000Z"
-    end_date = f"{year}-{month.zfill(2)}-31T23:59:59.999Z"
+    # Format the start and end dates based on user input; the last day comes
+    # from monthrange so short months (and Feb 29 in leap years) stay valid
+    last_day = monthrange(int(year), int(month))[1]
+    start_date = f"{year}-{int(month):02d}-01T00:00:00.000Z"
+    end_date = f"{year}-{int(month):02d}-{last_day:02d}T23:59:59.999Z"
 
     logging.info(f"Fetching `REFUND` transactions from {start_date} to {end_date}...")
 
-    # Retrieve finance transactions
-    finance_df = get_finance_transactions(oauth_user_token, start_date, end_date)
+    # Retrieve refund transactions, already filtered and flattened
+    refund_transactions_df = get_refund_transactions(oauth_user_token, start_date, end_date)
 
-    # If no data is returned, stop the script
-    if finance_df.empty:
-        logging.info("No transactions found for the specified period.")
+    if refund_transactions_df.empty:
+        logging.info("No refund transactions found for the specified period.")
     else:
-        # Filter and process refund transactions
-        refund_transactions_df = process_refund_transactions(finance_df)
-
         # Display only refund-related transactions
         display_refunds(refund_transactions_df)
@@ -1,13 +1,30 @@
+import argparse
 import os
 import requests
+import threading
 from ebaysdk.trading import Connection as Trading
 from ebaysdk.exception import ConnectionError
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
-from decimal import Decimal, ROUND_HALF_UP
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import logging
-import pytz
+from zoneinfo import ZoneInfo
+
+# orjson parses the large Finance API pages several times faster than the
+# stdlib json module; fall back gracefully when it isn't installed
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    import json
+    _loads = json.loads
 
 # Set up logging configuration
 logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
@@ -27,6 +44,21 @@ oauth_user_token = os.getenv('EBAY_OAUTH_USER_TOKEN')
 if not all([DEVID, APPID, CERTID, TOKEN, oauth_user_token]):
     raise ValueError("One or more API credentials are missing.")
 
+# Hoisted so the tzdata file lookup happens once, not per get_date_range
+# call; zoneinfo is C-implemented and attaches directly via tzinfo=,
+# without pytz's localize() wrapper
+PACIFIC = ZoneInfo('US/Pacific')
+
+# One pooled session for all Finance API pages: connections are reused
+# across requests (no TLS handshake per page) and throttling/5xx responses
+# are retried with backoff
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=(429, 500, 502, 503, 504))
+))
+
 def prompt_for_year_and_month():
     current_year = datetime.now().year
     while True:
@@ -44,37 +76,109 @@ def prompt_for_year_and_month():
         except ValueError:
             print("Invalid input. Please enter numeric values for year and month.")
 
+# Deterministic in (year, month); memoized for callers that batch months
+@lru_cache(maxsize=32)
 def get_date_range(year, month):
-    pacific = pytz.timezone('US/Pacific')
-    start_date = pacific.localize(datetime(year, month, 1))
+    start_date = datetime(year, month, 1, tzinfo=PACIFIC)
     if month == 12:
-        end_date = pacific.localize(datetime(year + 1, 1, 1)) - timedelta(seconds=1)
+        end_date = datetime(year + 1, 1, 1, tzinfo=PACIFIC) - timedelta(seconds=1)
     else:
-        end_date = pacific.localize(datetime(year, month + 1, 1)) - timedelta(seconds=1)
+        end_date = datetime(year, month + 1, 1, tzinfo=PACIFIC) - timedelta(seconds=1)
 
-    start_date_utc = start_date.astimezone(pytz.utc)
-    end_date_utc = end_date.astimezone(pytz.utc)
+    start_date_utc = start_date.astimezone(timezone.utc)
+    end_date_utc = end_date.astimezone(timezone.utc)
 
     return start_date_utc.strftime('%Y-%m-%dT%H:%M:%S.%fZ'), end_date_utc.strftime('%Y-%m-%dT%H:%M:%S.%fZ')
 
-def extract_decimal(data, key_path, default='0'):
-    value = data
-    for key in key_path:
-        value = value.get(key, {})
-    return Decimal(value.get('value', default)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+# Trading API responses live in this namespace; precompiled qualified paths
+# for the hot fields so each one is a single C-level findtext
+EBAY_NS = '{urn:ebay:apis:eBLBaseComponents}'
+_ORDER_TAG = f'{EBAY_NS}Order'
+_ORDER_ID_PATH = f'{EBAY_NS}OrderID'
+_TRANSACTION_TAG = f'{EBAY_NS}Transaction'
+_TITLE_PATH = f'{EBAY_NS}Item/{EBAY_NS}Title'
+_QUANTITY_PATH = f'{EBAY_NS}QuantityPurchased'
+_ITEM_PRICE_PATH = f'{EBAY_NS}TransactionPrice'
+_SHIPPING_PATH = f'{EBAY_NS}ActualShippingCost'
+_TAX_PATH = f'{EBAY_NS}Taxes/{EBAY_NS}TotalTaxAmount'
+_FVF_PATH = f'{EBAY_NS}FinalValueFee'
+_HANDLING_PATH = f'{EBAY_NS}ActualHandlingCost'
+_TOTAL_PAGES_PATH = f'.//{EBAY_NS}TotalNumberOfPages'
+
+def _net_sale_kernel(item, shipping, tax, fvf, handling, quantity):
+    """
+    Numeric kernel for the per-unit sale/net-sale arithmetic, all in int64
+    cents: (2a + q) // (2q) is ROUND_HALF_UP division by quantity, and the
+    remaining sums/thresholds are exact integer ops. Pure array math so
+    numba can JIT-compile it when installed; without numba it runs as the
+    same single vectorized NumPy pass.
+    """
+    shipping = (2 * shipping + quantity) // (2 * quantity)
+    tax = (2 * tax + quantity) // (2 * quantity)
+    fvf = (2 * fvf + quantity) // (2 * quantity)
+    handling = (2 * handling + quantity) // (2 * quantity)
+    sale = item + shipping + tax + handling
+    insertion = np.where(sale <= 1000, np.int64(30), np.int64(40))
+    net = sale - tax - fvf - insertion - shipping
+    return sale, net, fvf, insertion, shipping, handling, tax
+
+try:
+    from numba import njit
+    # parallel=True lets numba split the array expressions across cores on
+    # big months; fastmath is pointless (and risky) for integer math
+    _net_sale_kernel = njit(cache=True, parallel=True)(_net_sale_kernel)
+except ImportError:
+    pass
+
+def _to_cents(series):
+    """Convert a column of raw amount strings (or floats) to int64 cents."""
+    return (pd.to_numeric(series) * 100).round().astype('int64')
+
+@lru_cache(maxsize=32)
+def _trading_api(thread_id=None):
+    """
+    One cached Trading connection per worker thread, so the TLS handshake
+    and config load happen once instead of on every call. ebaysdk keeps
+    per-call state on the connection, hence the per-thread key.
+    """
+    return Trading(domain='api.ebay.com', appid=APPID, devid=DEVID, certid=CERTID, token=TOKEN, config_file=None)
 
 def fetch_sold_items(start_date, end_date):
+    """
+    Fetches all completed orders in the date range, following GetOrders
+    pagination. The first page reports the total page count; remaining
+    pages are requested concurrently since each call is a network
+    round-trip.
+
+    Returns the parsed XML DOM of each page rather than ebaysdk's nested
+    dict conversion; SalesAggregator.add_orders walks the trees directly.
+    """
+    request = {
+        'DetailLevel': 'ReturnAll',
+        'CreateTimeFrom': start_date,
+        'CreateTimeTo': end_date,
+        'OrderStatus': 'Completed',
+        'IncludeFinalValueFee': True
+    }
+
+    def fetch_page(page_number):
+        api = _trading_api(threading.get_ident())
+        return api.execute('GetOrders', {
+            **request,
+            'Pagination': {'EntriesPerPage': 100, 'PageNumber': page_number}
+        }).dom()
+
     try:
-        api = Trading(domain='api.ebay.com', appid=APPID, devid=DEVID, certid=CERTID, token=TOKEN, config_file=None)
-        response = api.execute('GetOrders', {
-            'DetailLevel': 'ReturnAll',
-            'CreateTimeFrom': start_date,
-            'CreateTimeTo': end_date,
-            'OrderStatus': 'Completed',
-            'IncludeFinalValueFee': True
-        })
-        logging.info("API call successful. Response received.")
-        return response.dict()
+        first_page = fetch_page(1)
+        total_pages = int(first_page.findtext(_TOTAL_PAGES_PATH, '1'))
+
+        pages = [first_page]
+        if total_pages > 1:
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                pages.extend(executor.map(fetch_page, range(2, total_pages + 1)))
+
+        logging.info(f"API call successful. {total_pages} page(s) received.")
+        return pages
     except ConnectionError as e:
         logging.error(f"Connection error occurred: {e}")
         return None
@@ -82,52 +186,113 @@ def fetch_sold_items(start_date, end_date):
         logging.error(f"An unexpected error occurred: {e}")
         return None
 
-def process_sales_data(orders):
-    if not orders:
-        logging.info("No orders to process.")
-        return pd.DataFrame()
-
-    order_array = orders.get('OrderArray', {}).get('Order', [])
-    items = []
-    
-    for order in order_array:
-        order_id = order['OrderID']
-        for transaction in order.get('TransactionArray', {}).get('Transaction', []):
-            quantity = int(transaction.get('QuantityPurchased', 1))
-            item_price = extract_decimal(transaction, ['TransactionPrice'])
-
-            # Extract total costs and calculate per-unit values
-            total_shipping_cost = extract_decimal(transaction, ['ActualShippingCost'])
-            total_sales_tax = extract_decimal(transaction, ['Taxes', 'TotalTaxAmount'])
-            total_final_value_fee = extract_decimal(transaction, ['FinalValueFee'])
-            total_handling_cost = extract_decimal(transaction, ['ActualHandlingCost'])
-
-            per_unit_shipping_cost = (total_shipping_cost / quantity).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if quantity else Decimal('0.00')
-            per_unit_sales_tax = (total_sales_tax / quantity).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if quantity else Decimal('0.00')
-            per_unit_final_value_fee = (total_final_value_fee / quantity).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if quantity else Decimal('0.00')
-            per_unit_handling_cost = (total_handling_cost / quantity).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) if quantity else Decimal('0.00')
-
-            # Calculate per-unit sale price and net sale
-            per_unit_sale_price = (item_price + per_unit_shipping_cost + per_unit_sales_tax + per_unit_handling_cost).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            insertion_fee = Decimal(0.30 if per_unit_sale_price <= Decimal('10.00') else 0.40).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            net_sale_without_ad_fee = (per_unit_sale_price - per_unit_sales_tax - per_unit_final_value_fee - insertion_fee - per_unit_shipping_cost).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-
-            # Create a separate row for each individual item in the transaction
-            for _ in range(quantity):
-                items.append({
-                    'OrderID': order_id,
-                    'Title': transaction['Item']['Title'],
-                    'SalePrice': float(per_unit_sale_price),
-                    'NetSaleWithoutAdFee': float(net_sale_without_ad_fee),
-                    'FinalValueFee': float(per_unit_final_value_fee),
-                    'InsertionFee': float(insertion_fee),
-                    'ShippingCost': float(per_unit_shipping_cost),
-                    'HandlingCost': float(per_unit_handling_cost),
-                    'SalesTax': float(per_unit_sales_tax),
-                    'COGS': ''  # Placeholder for COGS
-                })
-
-    return pd.DataFrame(items)
+class SalesAggregator:
+    """
+    Accumulates per-transaction sales rows while flattening GetOrders; the
+    DataFrame is built exactly once at the end, with ad fees attached there
+    through a C-level hash join.
+    """
+
+    def __init__(self):
+        # Structure-of-arrays: one Python list per column, so the DataFrame
+        # wraps ready-made lists instead of inferring dtypes from a list of
+        # per-row dicts
+        self.columns = {
+            'OrderID': [], 'Title': [], 'Quantity': [], 'ItemPrice': [],
+            'ShippingCost': [], 'SalesTax': [], 'FinalValueFee': [], 'HandlingCost': []
+        }
+
+    def add_orders(self, page):
+        """
+        Flatten one parsed GetOrders page into raw string amount columns,
+        reading fields straight off the XML tree instead of ebaysdk's
+        intermediate nested-dict conversion.
+        """
+        cols = self.columns
+        for order in page.iter(_ORDER_TAG):
+            order_id = order.findtext(_ORDER_ID_PATH, '')
+            for transaction in order.iter(_TRANSACTION_TAG):
+                # One entry per transaction; expansion to one row per unit
+                # happens in bulk via Index.repeat in to_dataframe
+                cols['OrderID'].append(order_id)
+                cols['Title'].append(transaction.findtext(_TITLE_PATH, ''))
+                cols['Quantity'].append(int(transaction.findtext(_QUANTITY_PATH, '1')) or 1)
+                cols['ItemPrice'].append(transaction.findtext(_ITEM_PRICE_PATH, '0'))
+                cols['ShippingCost'].append(transaction.findtext(_SHIPPING_PATH, '0'))
+                cols['SalesTax'].append(transaction.findtext(_TAX_PATH, '0'))
+                cols['FinalValueFee'].append(transaction.findtext(_FVF_PATH, '0'))
+                cols['HandlingCost'].append(transaction.findtext(_HANDLING_PATH, '0'))
+
+            # Release the subtree once its columns are out so peak memory
+            # stays flat regardless of month size
+            order.clear()
+
+    def to_dataframe(self, ad_fees_df=None, estimate_ad_fees=False):
+        """
+        Builds the final DataFrame and runs the numeric kernel once.
+        ad_fees_df is an optional per-order frame with OrderID/AdFee
+        columns, left-joined onto the sales rows; estimate_ad_fees
+        instead charges a flat 2% of the per-unit sale price, for runs
+        without Finance API access.
+        """
+        if not self.columns['OrderID']:
+            return pd.DataFrame()
+
+        df = pd.DataFrame(self.columns, copy=False)
+
+        # Titles repeat heavily (same SKU sold many times); category dtype
+        # stores each distinct string once, so the repeat expansion below
+        # duplicates int codes instead of strings
+        df['Title'] = df['Title'].astype('category')
+
+        # pandas merge is a khash-backed hash join in C; rows without a fee
+        # entry get 0.0, matching left-join semantics. pyarrow-backed string
+        # keys hash faster than object strings, sort=False skips the output
+        # sort, and validate='m:1' asserts one fee row per order (guaranteed
+        # by the groupby in get_ad_fees_dataframe)
+        if ad_fees_df is not None and not ad_fees_df.empty:
+            df['OrderID'] = df['OrderID'].astype('string[pyarrow]')
+            ad_fees_df = ad_fees_df.copy()
+            ad_fees_df['OrderID'] = ad_fees_df['OrderID'].astype('string[pyarrow]')
+            df = df.merge(ad_fees_df, on='OrderID', how='left', sort=False, validate='m:1')
+            df['AdFee'] = df['AdFee'].fillna(0.0)
+        else:
+            df['AdFee'] = 0.0
+
+        # Per-unit conversion, sale price and net sale in one integer-cents
+        # kernel; floats only appear at the divisions below
+        sale_c, net_c, fvf_c, insertion_c, shipping_c, handling_c, tax_c = _net_sale_kernel(
+            _to_cents(df['ItemPrice']).to_numpy(),
+            _to_cents(df['ShippingCost']).to_numpy(),
+            _to_cents(df['SalesTax']).to_numpy(),
+            _to_cents(df['FinalValueFee']).to_numpy(),
+            _to_cents(df['HandlingCost']).to_numpy(),
+            df['Quantity'].to_numpy(np.int64)
+        )
+        if estimate_ad_fees:
+            # 2% of the per-unit sale; (x*2 + 50) // 100 is ROUND_HALF_UP
+            # in cents, matching ebay_sale_project.py's estimate
+            ad_fee_c = (sale_c * 2 + 50) // 100
+        else:
+            ad_fee_c = _to_cents(df['AdFee']).to_numpy()
+
+        df['SalePrice'] = sale_c / 100.0
+        df['NetSaleWithoutAdFee'] = net_c / 100.0
+        df['NetSale'] = (net_c - ad_fee_c) / 100.0
+        df['AdFee'] = ad_fee_c / 100.0
+        df['FinalValueFee'] = fvf_c / 100.0
+        df['InsertionFee'] = insertion_c / 100.0
+        df['ShippingCost'] = shipping_c / 100.0
+        df['HandlingCost'] = handling_c / 100.0
+        df['SalesTax'] = tax_c / 100.0
+        df['COGS'] = ''  # Placeholder for COGS
+
+        # Expand to one row per individual item in a single C-level gather
+        # instead of duplicating dicts quantity times while flattening
+        df = df.loc[df.index.repeat(df['Quantity'].to_numpy())].reset_index(drop=True)
+
+        return df[['OrderID', 'Title', 'SalePrice', 'NetSaleWithoutAdFee', 'NetSale', 'AdFee',
+                   'FinalValueFee', 'InsertionFee', 'ShippingCost', 'HandlingCost', 'SalesTax', 'COGS']]
 
 def get_finance_transactions(oauth_user_token, start_date, end_date, transaction_type, fee_type=None):
     base_url = 'https://apiz.ebay.com/sell/finances/v1/transaction'
@@ -136,81 +301,98 @@ def get_finance_transactions(oauth_user_token, start_date, end_date, transaction
         'Accept': 'application/json',
         'X-EBAY-C-MARKETPLACE-ID': 'EBAY_US'
     }
-    params = {
-        'limit': '1000',
+    limit = 1000
+    base_params = {
+        'limit': str(limit),
         'transactionDateRangeFrom': start_date,
         'transactionDateRangeTo': end_date,
         'transactionType': transaction_type
     }
     if fee_type:
-        params['feeType'] = fee_type
-
-    all_transactions = []
-    url = base_url
+        base_params['feeType'] = fee_type
 
-    while True:
-        response = requests.get(url, headers=headers, params=params)
-        if response.status_code == 200:
-            data = response.json()
-            all_transactions.extend(data.get('transactions', []))
-            next_page = None
-            for link in data.get('links', []):
-                if link.get('rel') == 'next':
-                    next_page = link.get('href')
-                    break
-            if next_page:
-                url = next_page
-                params = {}
-            else:
-                break
-        else:
+    def fetch_page(offset):
+        response = _SESSION.get(base_url, headers=headers, params={**base_params, 'offset': str(offset)})
+        if response.status_code != 200:
             logging.error(f"Error fetching transactions: {response.status_code} - {response.text}")
-            break
+            return None
+
+        return _loads(response.content)
+
+    # The first page reports the total; fan out over the remaining offset
+    # windows concurrently since each page is a network-bound round-trip
+    first_page = fetch_page(0)
+    if not first_page:
+        return []
+
+    all_transactions = list(first_page.get('transactions', []))
+    total = int(first_page.get('total', len(all_transactions)))
+
+    if total > limit:
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for page in executor.map(fetch_page, range(limit, total, limit)):
+                if page:
+                    all_transactions.extend(page.get('transactions', []))
 
     return all_transactions
 
-def get_ad_fees_dataframe(transactions):
-    ad_fees = []
+def iter_ad_fees(transactions):
+    """
+    Single fused pass over the transactions: filter to ad-fee charges,
+    find the ORDER_ID reference, and yield (order_id, amount) pairs
+    without building intermediate filtered lists.
+    """
     for tx in transactions:
-        order_id = None
-        for ref in tx.get('references', []):
+        if tx.get('feeType') != 'AD_FEE' or tx.get('transactionType') != 'NON_SALE_CHARGE':
+            continue
+        amount = float(tx['amount']['value'])
+        for ref in tx.get('references', ()):
             if ref.get('referenceType') == 'ORDER_ID':
-                order_id = ref.get('referenceId')
+                yield ref['referenceId'], amount
                 break
-        if order_id:
-            ad_fee = Decimal(tx.get('amount', {}).get('value', '0')).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
-            ad_fees.append({
-                'OrderID': order_id,
-                'AdFee': float(ad_fee)
-            })
-    return pd.DataFrame(ad_fees)
+
+def get_ad_fees_dataframe(transactions):
+    """
+    Collapses ad-fee transactions to one OrderID/AdFee row per order;
+    the groupby-sum folds repeat fee entries for the same order.
+    """
+    ad_fees = pd.DataFrame.from_records(iter_ad_fees(transactions), columns=['OrderID', 'AdFee'])
+    if ad_fees.empty:
+        return ad_fees
+    return ad_fees.groupby('OrderID', sort=False, as_index=False)['AdFee'].sum()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monthly net-sale report from eBay Trading + Finance APIs.")
+    parser.add_argument('--ad-fees', choices=('api', 'estimate'), default='api',
+                        help="ad fee source: real charges from the Finance API, or a flat 2%% estimate")
+    args = parser.parse_args()
+
     year, month = prompt_for_year_and_month()
     start_date, end_date = get_date_range(year, month)
-    
-    orders = fetch_sold_items(start_date, end_date)
-    if not orders:
+
+    pages = fetch_sold_items(start_date, end_date)
+    if not pages:
         logging.error("No orders retrieved.")
     else:
-        sales_data_df = process_sales_data(orders)
-        
-        ad_transactions = get_finance_transactions(
-            oauth_user_token, start_date, end_date,
-            transaction_type='NON_SALE_CHARGE',
-            fee_type='AD_FEE'
-        )
-        ad_fees_df = get_ad_fees_dataframe(ad_transactions) if ad_transactions else pd.DataFrame(columns=['OrderID', 'AdFee'])
-        
-        merged_df = pd.merge(sales_data_df, ad_fees_df, on='OrderID', how='left')
-        merged_df['AdFee'] = merged_df['AdFee'].fillna(0)
-        
-        merged_df['NetSale'] = merged_df.apply(
-            lambda row: Decimal(row['NetSaleWithoutAdFee'] - row['AdFee']).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP),
-            axis=1
-        ).astype(float)
-        
+        aggregator = SalesAggregator()
+        for page in pages:
+            aggregator.add_orders(page)
+
+        if args.ad_fees == 'api':
+            ad_transactions = get_finance_transactions(
+                oauth_user_token, start_date, end_date,
+                transaction_type='NON_SALE_CHARGE',
+                fee_type='AD_FEE'
+            )
+            ad_fees_df = get_ad_fees_dataframe(ad_transactions) if ad_transactions else None
+            final_df = aggregator.to_dataframe(ad_fees_df)
+        else:
+            final_df = aggregator.to_dataframe(estimate_ad_fees=True)
+
         # Drop 'OrderID' from the final output
-        merged_df = merged_df[['Title', 'SalePrice', 'NetSale', 'COGS']]
-        merged_df.to_csv('proper_net_sale.csv', index=False)
+        merged_df = final_df[['Title', 'SalePrice', 'NetSale', 'COGS']]
+        # Arrow's CSV writer formats columns in parallel in C, instead of
+        # pandas' per-cell Python formatting
+        table = pa.Table.from_pandas(merged_df, preserve_index=False)
+        pacsv.write_csv(table, 'proper_net_sale.csv')
         print("Data written to 'proper_net_sale.csv'")